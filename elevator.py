@@ -74,335 +74,438 @@
 # that is focused on its interaction with "real" world elements.  For
 # example:
 
-import copy
 import random
 from abc import ABC
-from dataclasses import dataclass, field
-from enum import Enum
+from dataclasses import dataclass
+from enum import IntEnum
+from functools import lru_cache
 from collections import deque
-from typing import List
+from typing import Sequence
 
 
-class Direction(Enum):
+class Direction(IntEnum):
     NONE = 1
     UP = 2
     DOWN = 3
 
+    # print members as e.g. Direction.UP rather than their int value
+    def __str__(self):
+        return f"{type(self).__name__}.{self.name}"
 
-class DoorMotion(Enum):
+
+class DoorMotion(IntEnum):
     NONE = 1
     OPEN = 2
     CLOSE = 3
 
+    # print members as e.g. Direction.UP rather than their int value
+    def __str__(self):
+        return f"{type(self).__name__}.{self.name}"
+
 
 class ControlOutput(ABC):
-    pass
+    __slots__ = ()
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class HoistMotor(ControlOutput):
     direction: Direction
 
 
 class StopMotor(ControlOutput):
-    pass
+    __slots__ = ()
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class DoorMotor(ControlOutput):
     motion: DoorMotion
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class SetTimer(ControlOutput):
     pass
 
 
+# control outputs carry no per-event data, so states share these instances
+_HOIST_UP = HoistMotor(direction=Direction.UP)
+_HOIST_DOWN = HoistMotor(direction=Direction.DOWN)
+_DOOR_OPEN = DoorMotor(motion=DoorMotion.OPEN)
+_DOOR_CLOSE = DoorMotor(motion=DoorMotion.CLOSE)
+_SET_TIMER = SetTimer()
+_STOP = StopMotor()
+
+# precomputed control output sequences returned by the states
+_NO_OUTPUT = ()
+_OUTPUTS_SET_TIMER = (_SET_TIMER,)
+_OUTPUTS_OPEN_DOOR_TIMER = (_DOOR_OPEN, _SET_TIMER)
+_OUTPUTS_STOP_OPEN_DOOR_TIMER = (_STOP, _DOOR_OPEN, _SET_TIMER)
+_OUTPUTS_CLOSE_DOOR = (_DOOR_CLOSE,)
+_OUTPUTS_HOIST = {Direction.UP: (_HOIST_UP,), Direction.DOWN: (_HOIST_DOWN,)}
+_OUTPUTS_CLOSE_DOOR_HOIST = {
+    Direction.UP: (_DOOR_CLOSE, _HOIST_UP),
+    Direction.DOWN: (_DOOR_CLOSE, _HOIST_DOWN),
+}
+
+
 class Event(ABC):
-    pass
+    __slots__ = ()
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class DestinationFloorSelected(Event):
     destination_floor: int
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class RequestButtonPressed(Event):
     floor: int
     direction: Direction
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class ReachedFloor(Event):
     floor: int
 
 
 class TimerExpired(Event):
-    pass
+    __slots__ = ()
+
+
+# integer ids of the states, see State._KIND
+_IDLE, _MOVING, _LOADING = 0, 1, 2
 
 
 class State(ABC):
-    def __init__(self, elevator):
-        self._elevator = elevator
+    __slots__ = ()
 
     def _unsupported_event(self, event):
         raise RuntimeError(f"Unsupported event:{event} in state {self}")
 
-    def _new_state(self, state_cls):
-        return state_cls(elevator=self._elevator)
-
     def __repr__(self):
         return f"{type(self).__name__}"
 
-    # handles the event and returns HandleEventResult
-    def handle_event(self, event: Event):
-        pass
-
 
+# The states only identify which operational mode the elevator is in, the
+# events are handled by the transition functions in _TRANSITIONS below. As
+# they hold no data, every elevator shares the singletons defined after them.
 class Idle(State):
-    def handle_event(self, event):
-        assert not self._elevator.destinations
-        assert self._elevator.going_direction == Direction.NONE
-
-        if isinstance(event, RequestButtonPressed):
-            # if current floor has a request, just opens the door
-            if event.floor == self._elevator.current_floor:
-                return HandleEventResult(
-                    next_state=Loading(elevator=self._elevator),
-                    control_output=[SetTimer()],
-                )
-            else:
-                # TODO: this is simplified, as soon as one request of elevator
-                # is pressed, the elevator starts moving.
-                self._elevator.receive_request(event)
-                return HandleEventResult(
-                    next_state=Moving(elevator=self._elevator),
-                    control_output=[
-                        HoistMotor(direction=self._elevator.going_direction)
-                    ],
-                )
-        elif isinstance(event, DestinationFloorSelected):
-            if event.destination_floor == self._elevator.current_floor:
-                # print(f"Passenger, you are already at floor: {event.destination_floor}")
-                # TODO: maybe reset the timer?
-                return HandleEventResult(
-                    next_state=Loading(elevator=self._elevator),
-                    control_output=[DoorMotor(motion=DoorMotion.OPEN), SetTimer()],
-                )
-            else:
-                self._elevator.receive_destination(event.destination_floor)
-                return HandleEventResult(
-                    next_state=Moving(elevator=self._elevator),
-                    control_output=[
-                        HoistMotor(direction=self._elevator.going_direction)
-                    ],
-                )
-        else:
-            self._unsupported_event(event)
+    __slots__ = ()
+    _KIND = _IDLE
 
 
 class Moving(State):
-    def handle_event(self, event):
-        if isinstance(event, ReachedFloor):
-            need_to_open_door = self._elevator.reach_floor(event.floor)
-            if need_to_open_door:
-                return HandleEventResult(
-                    next_state=Loading(elevator=self._elevator),
-                    control_output=[
-                        StopMotor(),
-                        DoorMotor(motion=DoorMotion.OPEN),
-                        SetTimer(),
-                    ],
-                )
-            else:
-                return HandleEventResult(
-                    next_state=Moving(elevator=self._elevator),
-                    control_output=[
-                        HoistMotor(direction=self._elevator.going_direction)
-                    ],
-                )
-        elif isinstance(event, DestinationFloorSelected):
-            # notice a moving elevator will not stop when the current floor is pressed
-            self._elevator.receive_destination(event.destination_floor)
-            return HandleEventResult(
-                next_state=Moving(elevator=self._elevator),
-                control_output=[HoistMotor(direction=self._elevator.going_direction)],
-            )
-        elif isinstance(event, RequestButtonPressed):
-            # elevator is moving, cannot stop immediately, so only record the request
-            self._elevator.receive_request(event)
-            return HandleEventResult(
-                next_state=Moving(elevator=self._elevator),
-                control_output=[HoistMotor(direction=self._elevator.going_direction)],
-            )
-        else:
-            self._unsupported_event(event)
+    __slots__ = ()
+    _KIND = _MOVING
 
 
 class Loading(State):
-    def handle_event(self, event):
-        if isinstance(event, DestinationFloorSelected):
-            if event.destination_floor == self._elevator.current_floor:
-                # if the door is open and passenger pressed current, keep the door open
-                # this passenger is confused.
-                # print(f"Passenger, you are already at floor: {event.destination_floor}")
-                # TODO: maybe reset the timer?
-                pass
-            else:
-                self._elevator.receive_destination(event.destination_floor)
-            return HandleEventResult(
-                next_state=Loading(elevator=self._elevator), control_output=[]
-            )
-        elif isinstance(event, RequestButtonPressed):
-            # elevator door is open, just record the request
-            self._elevator.receive_request(event)
-            return HandleEventResult(
-                next_state=Loading(elevator=self._elevator), control_output=[]
-            )
-        elif isinstance(event, TimerExpired):
-            # time to close the door
-            need_to_move = self._elevator.close_door()
-            if need_to_move:
-                return HandleEventResult(
-                    next_state=Moving(elevator=self._elevator),
-                    control_output=[
-                        DoorMotor(motion=DoorMotion.CLOSE),
-                        HoistMotor(direction=self._elevator.going_direction),
-                    ],
-                )
-            else:
-                return HandleEventResult(
-                    next_state=Idle(elevator=self._elevator),
-                    control_output=[DoorMotor(motion=DoorMotion.CLOSE)],
-                )
+    __slots__ = ()
+    _KIND = _LOADING
+
+
+IDLE = Idle()
+MOVING = Moving()
+LOADING = Loading()
+# indexed by the state kind
+_STATES = (IDLE, MOVING, LOADING)
+
+
+# Transition functions take the elevator and the event and return a
+# (next_state_kind, control_output) tuple.
+
+
+def _idle_on_request(elevator, event):
+    assert not elevator._destinations_mask
+    assert elevator._going_direction is Direction.NONE
+    # if current floor has a request, just opens the door
+    if event.floor == elevator._current_floor:
+        return (_LOADING, _OUTPUTS_SET_TIMER)
+    else:
+        # TODO: this is simplified, as soon as one request of elevator
+        # is pressed, the elevator starts moving.
+        elevator.receive_request(event)
+        return (_MOVING, _OUTPUTS_HOIST[elevator._going_direction])
+
+
+def _idle_on_dest(elevator, event):
+    assert not elevator._destinations_mask
+    assert elevator._going_direction is Direction.NONE
+    if event.destination_floor == elevator._current_floor:
+        # print(f"Passenger, you are already at floor: {event.destination_floor}")
+        # TODO: maybe reset the timer?
+        return (_LOADING, _OUTPUTS_OPEN_DOOR_TIMER)
+    else:
+        elevator.receive_destination(event.destination_floor)
+        return (_MOVING, _OUTPUTS_HOIST[elevator._going_direction])
+
+
+def _moving_on_reached(elevator, event):
+    need_to_open_door = elevator.reach_floor(event.floor)
+    if need_to_open_door:
+        return (_LOADING, _OUTPUTS_STOP_OPEN_DOOR_TIMER)
+    else:
+        return (_MOVING, _OUTPUTS_HOIST[elevator._going_direction])
+
+
+def _moving_on_dest(elevator, event):
+    # notice a moving elevator will not stop when the current floor is pressed
+    elevator.receive_destination(event.destination_floor)
+    return (_MOVING, _OUTPUTS_HOIST[elevator._going_direction])
+
+
+def _moving_on_request(elevator, event):
+    # elevator is moving, cannot stop immediately, so only record the request
+    elevator.receive_request(event)
+    return (_MOVING, _OUTPUTS_HOIST[elevator._going_direction])
+
+
+def _loading_on_dest(elevator, event):
+    if event.destination_floor == elevator._current_floor:
+        # if the door is open and passenger pressed current, keep the door open
+        # this passenger is confused.
+        # print(f"Passenger, you are already at floor: {event.destination_floor}")
+        # TODO: maybe reset the timer?
+        pass
+    else:
+        elevator.receive_destination(event.destination_floor)
+    return (_LOADING, _NO_OUTPUT)
+
+
+def _loading_on_request(elevator, event):
+    # elevator door is open, just record the request
+    elevator.receive_request(event)
+    return (_LOADING, _NO_OUTPUT)
+
+
+def _loading_on_timer(elevator, event):
+    # time to close the door
+    need_to_move = elevator.close_door()
+    if need_to_move:
+        return (_MOVING, _OUTPUTS_CLOSE_DOOR_HOIST[elevator._going_direction])
+    else:
+        return (_IDLE, _OUTPUTS_CLOSE_DOOR)
+
+
+# maps (state kind, event type) to its transition function
+_TRANSITIONS = {
+    (_IDLE, RequestButtonPressed): _idle_on_request,
+    (_IDLE, DestinationFloorSelected): _idle_on_dest,
+    (_MOVING, ReachedFloor): _moving_on_reached,
+    (_MOVING, DestinationFloorSelected): _moving_on_dest,
+    (_MOVING, RequestButtonPressed): _moving_on_request,
+    (_LOADING, DestinationFloorSelected): _loading_on_dest,
+    (_LOADING, RequestButtonPressed): _loading_on_request,
+    (_LOADING, TimerExpired): _loading_on_timer,
+}
+
+
+# Returns the direction the elevator should go next. This is a pure function of
+# the current floor, current going direction and the floor bitmasks (bit i set
+# means floor i) of outstanding destinations and requests. Being pure, its
+# results are memoized: the inputs are bounded by the number of floors and the
+# simulation keeps asking about the same combinations.
+@lru_cache(maxsize=None)
+def _compute_next_direction(
+    current_floor,
+    going_direction,
+    destinations_mask,
+    up_mask,
+    down_mask,
+    min_floor,
+    max_floor,
+):
+    # up and down requests are only ever looked at together
+    requests_mask = up_mask | down_mask
+    if not (destinations_mask | requests_mask):
+        return Direction.NONE
+    elif current_floor == min_floor:
+        # assert not destinations_mask & ((2 << current_floor) - 1)
+        return Direction.UP
+    elif current_floor == max_floor:
+        # assert not destinations_mask >> current_floor
+        return Direction.DOWN
+
+    # elevator prioritize unloading current passengers over picking up
+    # new ones.
+    elif going_direction is Direction.NONE:
+        mask = destinations_mask if destinations_mask else requests_mask
+        # go up if more floors in the mask are on the upper floors
+        if (mask >> current_floor).bit_count() > mask.bit_count() // 2:
+            return Direction.UP
+        else:
+            return Direction.DOWN
+    elif going_direction is Direction.UP:
+        # elevator is going up, so it will keep going up unless there is no need to go up.
+        if destinations_mask >> current_floor:
+            return Direction.UP
+        elif requests_mask >> current_floor:
+            return Direction.UP
         else:
-            self._unsupported_event(event)
+            return Direction.DOWN
+    else:
+        # elevator is going down, so it will keep going down unless there is no need to go down.
+        # mask of the floors at or below the current floor
+        lower_floors = (2 << current_floor) - 1
+        if destinations_mask & lower_floors:
+            return Direction.DOWN
+        elif requests_mask & lower_floors:
+            return Direction.DOWN
+        else:
+            return Direction.UP
 
 
-@dataclass
-class HandleEventResult:
-    next_state: State
-    control_output: List[ControlOutput] = field(default_factory=list)
+# Elevators that are no longer referenced, handed back by the simulation so
+# _clone and _from_key can refill them instead of allocating new ones.
+_elev_pool = []
 
 
 class Elevator:
+    __slots__ = (
+        "_state",
+        "_state_kind",
+        "_current_floor",
+        "_control",
+        "_going_direction",
+        "_destinations_mask",
+        "_up_mask",
+        "_down_mask",
+        "_hash",
+    )
+
     _MIN_FLOOR = 1
     _MAX_FLOOR = 5
 
+    # bit widths and offsets of the fields packed by _key, from the low bits
+    _MASK_BITS = _MAX_FLOOR + 1
+    _FLOOR_BITS = _MAX_FLOOR.bit_length()
+    _DIRECTION_BITS = max(Direction).bit_length()
+    _UP_SHIFT = _MASK_BITS
+    _DESTINATIONS_SHIFT = 2 * _MASK_BITS
+    _DIRECTION_SHIFT = 3 * _MASK_BITS
+    _FLOOR_SHIFT = _DIRECTION_SHIFT + _DIRECTION_BITS
+    _STATE_SHIFT = _FLOOR_SHIFT + _FLOOR_BITS
+    _FLOORS_MASK = (1 << _MASK_BITS) - 1
+    _FLOOR_MASK = (1 << _FLOOR_BITS) - 1
+    _DIRECTION_MASK = (1 << _DIRECTION_BITS) - 1
+
     def __init__(self, initial_floor, control):
-        self._state = Idle(self)
+        self._state = IDLE
+        # mirrors self._state._KIND so states can be compared as ints
+        self._state_kind = _IDLE
         self._current_floor = initial_floor
         self._control = control
         self._going_direction = Direction.NONE
-        self._destinations = set()
-        self._up_requests = set()
-        self._down_requests = set()
+        # floors are kept as bitmasks, bit i set means floor i is in the set
+        self._destinations_mask = 0
+        self._up_mask = 0
+        self._down_mask = 0
+        # cached __hash__ value, reset to None whenever the elevator changes
+        self._hash = None
+
+    # returns a copy of this elevator sharing the same control, much cheaper
+    # than copy.deepcopy as all the fields are scalars
+    def _clone(self):
+        elev = _elev_pool.pop() if _elev_pool else Elevator.__new__(Elevator)
+        elev._state = self._state
+        elev._state_kind = self._state_kind
+        elev._current_floor = self._current_floor
+        elev._control = self._control
+        elev._going_direction = self._going_direction
+        elev._destinations_mask = self._destinations_mask
+        elev._up_mask = self._up_mask
+        elev._down_mask = self._down_mask
+        elev._hash = self._hash
+        return elev
 
     def _as_tuple(self):
         return (
-            type(self._state),
+            self._state_kind,
             self._current_floor,
             self._going_direction,
-            self._destinations,
-            self._up_requests,
-            self._down_requests,
+            self._destinations_mask,
+            self._up_mask,
+            self._down_mask,
         )
 
     def __eq__(self, other):
         return self._as_tuple() == other._as_tuple()
 
-    def __hash__(self):
-        return hash(
-            (
-                type(self._state),
-                self._current_floor,
-                self._going_direction,
-                frozenset(self._destinations),
-                frozenset(self._up_requests),
-                frozenset(self._down_requests),
-            )
+    # packs the same fields as _as_tuple into a single int, equal elevators
+    # have equal keys. Layout from the high bits: state, current floor
+    # (_FLOOR_BITS), going direction (_DIRECTION_BITS) and then the
+    # destinations, up and down masks (_MASK_BITS each, bit i is floor i).
+    def _key(self):
+        return (
+            (self._state_kind << Elevator._STATE_SHIFT)
+            | (self._current_floor << Elevator._FLOOR_SHIFT)
+            | (self._going_direction << Elevator._DIRECTION_SHIFT)
+            | (self._destinations_mask << Elevator._DESTINATIONS_SHIFT)
+            | (self._up_mask << Elevator._UP_SHIFT)
+            | self._down_mask
         )
 
+    # rebuilds an elevator from a key returned by _key
+    @staticmethod
+    def _from_key(key, control):
+        elev = _elev_pool.pop() if _elev_pool else Elevator.__new__(Elevator)
+        elev._state_kind = key >> Elevator._STATE_SHIFT
+        elev._state = _STATES[elev._state_kind]
+        elev._current_floor = (key >> Elevator._FLOOR_SHIFT) & Elevator._FLOOR_MASK
+        elev._control = control
+        elev._going_direction = Direction(
+            (key >> Elevator._DIRECTION_SHIFT) & Elevator._DIRECTION_MASK
+        )
+        elev._destinations_mask = (
+            key >> Elevator._DESTINATIONS_SHIFT
+        ) & Elevator._FLOORS_MASK
+        elev._up_mask = (key >> Elevator._UP_SHIFT) & Elevator._FLOORS_MASK
+        elev._down_mask = key & Elevator._FLOORS_MASK
+        elev._hash = None
+        return elev
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(self._as_tuple())
+        return self._hash
+
     @property
     def current_floor(self):
         return self._current_floor
 
     @property
     def destinations(self):
-        return self._destinations
+        return self._mask_to_floors(self._destinations_mask)
 
     @property
     def going_direction(self):
         return self._going_direction
 
-    def _count_higher_floors(self, floor_set):
-        # returns the number of floors that are higher than current floor in the floor_set
-        return sum(1 for floor in floor_set if floor >= self._current_floor)
-
-    def _count_lower_floors(self, floor_set):
-        # returns the number of floors that are lower than current floor in the floor_set
-        return sum(1 for floor in floor_set if floor <= self._current_floor)
-
-    def _get_direction_with_floor_set(self, floor_set):
-        # returns Direction.UP if more floors in the floor_set is on the upper floors
-        # compared to current floor
-        return (
-            Direction.UP
-            if self._count_higher_floors(floor_set) > len(floor_set) // 2
-            else Direction.DOWN
-        )
+    @staticmethod
+    def _mask_to_floors(mask):
+        return {
+            floor
+            for floor in range(Elevator._MIN_FLOOR, Elevator._MAX_FLOOR + 1)
+            if mask & (1 << floor)
+        }
 
     def _update_direction(self):
-        # Notice current_floor can still be in self._destinations as it might have been
+        # Notice current_floor can still be in the destinations as it might have been
         # just added by a passenger pressing the current floor while the elevator is moving
-        # assert self._current_floor not in self._destinations
-
-        # next direction is purely a function of current going direction,
-        # any outstanding destinations and any outstanding requests
-        if not any([self._destinations, self._up_requests, self._down_requests]):
-            next_direction = Direction.NONE
-        elif self._current_floor == Elevator._MIN_FLOOR:
-            # assert self._count_lower_floors(self._destinations) == 0
-            next_direction = Direction.UP
-        elif self._current_floor == Elevator._MAX_FLOOR:
-            # assert self._count_higher_floors(self._destinations) == 0
-            next_direction = Direction.DOWN
-
-        # elevator prioritize unloading current passengers over picking up
-        # new ones.
-        elif self._going_direction == Direction.NONE:
-            if self._destinations:
-                next_direction = self._get_direction_with_floor_set(self._destinations)
-            else:
-                next_direction = self._get_direction_with_floor_set(
-                    self._up_requests.union(self._down_requests)
-                )
-        elif self._going_direction == Direction.UP:
-            # elevator is going up, so it will keep going up unless there is no need to go up.
-            if self._count_higher_floors(self._destinations) > 0:
-                next_direction = Direction.UP
-            elif (
-                self._count_higher_floors(self._up_requests.union(self._down_requests))
-                > 0
-            ):
-                next_direction = Direction.UP
-            else:
-                next_direction = Direction.DOWN
-        else:
-            # elevator is going down, so it will keep going down unless there is no need to go down.
-            if self._count_lower_floors(self._destinations) > 0:
-                next_direction = Direction.DOWN
-            elif (
-                self._count_lower_floors(self._up_requests.union(self._down_requests))
-                > 0
-            ):
-                next_direction = Direction.DOWN
-            else:
-                next_direction = Direction.UP
+        # assert not self._destinations_mask & (1 << self._current_floor)
+        next_direction = _compute_next_direction(
+            self._current_floor,
+            self._going_direction,
+            self._destinations_mask,
+            self._up_mask,
+            self._down_mask,
+            Elevator._MIN_FLOOR,
+            Elevator._MAX_FLOOR,
+        )
 
+        # every mutation of the floors ends up here
+        self._hash = None
         old_direction = self._going_direction
-        if old_direction != next_direction:
+        if old_direction is not next_direction:
             # print(f"Updating direction from {old_direction} to {next_direction}")
             pass
         self._going_direction = next_direction
@@ -410,21 +513,24 @@ class Elevator:
     # returns True if needs to open door for loading or unloading
     def reach_floor(self, floor):
         assert floor >= Elevator._MIN_FLOOR and floor <= Elevator._MAX_FLOOR
-        assert self._going_direction != Direction.NONE
+        going_direction = self._going_direction
+        assert going_direction is not Direction.NONE
         # print(f"Elevator reached floor: {floor}")
         previous_floor = self._current_floor
         self._current_floor = floor
-        assert abs(previous_floor - self._current_floor) == 1
+        assert abs(previous_floor - floor) == 1
         result = False
-        if floor in self._destinations:
-            self._destinations.remove(floor)
+        bit = 1 << floor
+        if self._destinations_mask & bit:
+            self._destinations_mask &= ~bit
             result = True
         # pick up passengers along the right direction
-        if floor in self._up_requests and self._going_direction == Direction.UP:
-            self._up_requests.remove(floor)
-            result = True
-        if floor in self._down_requests and self._going_direction == Direction.DOWN:
-            self._down_requests.remove(floor)
+        if going_direction is Direction.UP:
+            if self._up_mask & bit:
+                self._up_mask &= ~bit
+                result = True
+        elif going_direction is Direction.DOWN and self._down_mask & bit:
+            self._down_mask &= ~bit
             result = True
         self._update_direction()
         return result
@@ -433,49 +539,94 @@ class Elevator:
     def close_door(self):
         # print(f"Elevator door closed at floor:{self._current_floor}")
         self._update_direction()
-        return False if self._going_direction == Direction.NONE else True
+        return False if self._going_direction is Direction.NONE else True
 
     def receive_request(self, request: RequestButtonPressed):
         assert not (
-            request.floor == Elevator._MIN_FLOOR and request.direction == Direction.DOWN
+            request.floor == Elevator._MIN_FLOOR and request.direction is Direction.DOWN
         )
         assert not (
-            request.floor == Elevator._MAX_FLOOR and request.direction == Direction.UP
+            request.floor == Elevator._MAX_FLOOR and request.direction is Direction.UP
         )
-        if request.direction == Direction.UP:
-            self._up_requests.add(request.floor)
+        if request.direction is Direction.UP:
+            self._up_mask |= 1 << request.floor
         else:
-            self._down_requests.add(request.floor)
+            self._down_mask |= 1 << request.floor
         self._update_direction()
 
     def receive_destination(self, floor):
-        self._destinations.add(floor)
+        self._destinations_mask |= 1 << floor
         self._update_direction()
 
+    # Returns False if handling the event is known to leave the elevator exactly
+    # as it is: a button that is already recorded while moving or loading, or
+    # the current floor selected while loading. Pressing it again only redoes
+    # _update_direction, which gives the same direction for unchanged floors.
+    def _would_change(self, event):
+        if self._state_kind == _IDLE:
+            return True
+        event_type = type(event)
+        if event_type is DestinationFloorSelected:
+            floor = event.destination_floor
+            if self._state_kind == _LOADING and floor == self._current_floor:
+                return False
+            return not self._destinations_mask & (1 << floor)
+        elif event_type is RequestButtonPressed:
+            if event.direction is Direction.UP:
+                return not self._up_mask & (1 << event.floor)
+            else:
+                return not self._down_mask & (1 << event.floor)
+        return True
+
     def handle_event(self, event):
         # print()
         # print(f"Elevator:{self}@floor{self._current_floor} received event:{event}")
-        result = self._state.handle_event(event)
-        self._state = result.next_state
-        self._control.handle_control_output(result.control_output)
+        transition = _TRANSITIONS.get((self._state_kind, type(event)))
+        if transition is None:
+            self._state._unsupported_event(event)
+        next_state_kind, control_output = transition(self, event)
+        self._state_kind = next_state_kind
+        self._state = _STATES[next_state_kind]
+        self._hash = None
+        self._control.handle_control_output(control_output)
 
     def validate(self):
         assert not (
             self._current_floor == Elevator._MIN_FLOOR
-            and self._going_direction == Direction.DOWN
+            and self._going_direction is Direction.DOWN
         )
 
         assert not (
             self._current_floor == Elevator._MAX_FLOOR
-            and self._going_direction == Direction.UP
+            and self._going_direction is Direction.UP
         )
 
         assert not (
-            isinstance(self._state, Idle) and self._going_direction != Direction.NONE
+            self._state_kind == _IDLE and self._going_direction is not Direction.NONE
         )
 
     def __repr__(self):
-        return f"Elevator(state:{self._state}, current_floor:{self._current_floor}, going_direction:{self._going_direction}, destinations: {self._destinations}, up_requests:{self._up_requests}, down_requests:{self._down_requests})"
+        return f"Elevator(state:{self._state}, current_floor:{self._current_floor}, going_direction:{self._going_direction}, destinations: {self._mask_to_floors(self._destinations_mask)}, up_requests:{self._mask_to_floors(self._up_mask)}, down_requests:{self._mask_to_floors(self._down_mask)})"
+
+
+# events are immutable, so the simulation reuses one instance of each
+_DEST_EVENTS = tuple(
+    DestinationFloorSelected(destination_floor=floor)
+    for floor in range(Elevator._MIN_FLOOR, Elevator._MAX_FLOOR + 1)
+)
+_UP_REQ_EVENTS = tuple(
+    RequestButtonPressed(floor=floor, direction=Direction.UP)
+    for floor in range(Elevator._MIN_FLOOR, Elevator._MAX_FLOOR)
+)
+_DOWN_REQ_EVENTS = tuple(
+    RequestButtonPressed(floor=floor, direction=Direction.DOWN)
+    for floor in range(Elevator._MIN_FLOOR + 1, Elevator._MAX_FLOOR + 1)
+)
+_REACHED_EVENTS = {
+    floor: ReachedFloor(floor=floor)
+    for floor in range(Elevator._MIN_FLOOR, Elevator._MAX_FLOOR + 1)
+}
+_TIMER_EXPIRED = TimerExpired()
 
 
 # Class for implementing "elevator" commands.
@@ -486,18 +637,24 @@ class Elevator:
 class ElevatorControl:
     def __init__(self, queit=False):
         self._queit = queit
+        if queit:
+            # nothing gets printed, so skip checking the commands altogether
+            self.handle_control_output = self._ignore_control_output
+
+    def _ignore_control_output(self, commands):
+        pass
 
     def _print(self, msg):
         if self._queit:
             return
 
-    def handle_control_output(self, commands: List[ControlOutput]):
+    def handle_control_output(self, commands: Sequence[ControlOutput]):
         for command in commands:
             if isinstance(command, HoistMotor):
-                assert command.direction != Direction.NONE
+                assert command.direction is not Direction.NONE
                 self._print(f"Running motor {command.direction}")
             elif isinstance(command, DoorMotor):
-                assert command.motion != DoorMotion.NONE
+                assert command.motion is not DoorMotion.NONE
                 self._print(f"Door motion {command.motion}")
             elif isinstance(command, StopMotor):
                 self._print(f"Stop motor")
@@ -526,57 +683,41 @@ class Simulator:
     @staticmethod
     def simulate():
         def do_it():
-            return random.choice([0, 1]) == 0
+            return random.getrandbits(1) == 0
 
         def get_next_elevator(elev):
             next_elev = set()
 
-            # all destination buttons pressed
-            for floor in range(Elevator._MIN_FLOOR, Elevator._MAX_FLOOR + 1):
-                new_elev = copy.deepcopy(elev)
-                new_elev.handle_event(DestinationFloorSelected(destination_floor=floor))
-                next_elev.add(new_elev)
-
-            # all up buttons
-            for floor in range(Elevator._MIN_FLOOR, Elevator._MAX_FLOOR):
-                new_elev = copy.deepcopy(elev)
-                new_elev.handle_event(
-                    RequestButtonPressed(floor=floor, direction=Direction.UP)
-                )
-                next_elev.add(new_elev)
-
-            # all down buttons
-            for floor in range(Elevator._MIN_FLOOR + 1, Elevator._MAX_FLOOR + 1):
-                new_elev = copy.deepcopy(elev)
-                new_elev.handle_event(
-                    RequestButtonPressed(floor=floor, direction=Direction.DOWN)
-                )
-                next_elev.add(new_elev)
+            # all destination buttons pressed, all up buttons and all down buttons
+            for events in (_DEST_EVENTS, _UP_REQ_EVENTS, _DOWN_REQ_EVENTS):
+                for event in events:
+                    if not elev._would_change(event):
+                        # the button leads back to this very elevator, no need
+                        # to clone and handle it
+                        next_elev.add(elev)
+                        continue
+                    new_elev = elev._clone()
+                    new_elev.handle_event(event)
+                    next_elev.add(new_elev)
 
             # simulate motion
-            if isinstance(elev._state, Moving):
-                assert elev._going_direction != Direction.NONE
-
-            if (
-                isinstance(elev._state, Moving)
-                and elev._going_direction == Direction.UP
-            ):
-                new_elev = copy.deepcopy(elev)
-                new_elev.handle_event(ReachedFloor(floor=elev._current_floor + 1))
+            if elev._state_kind == _MOVING:
+                assert elev._going_direction is not Direction.NONE
+
+            if elev._state_kind == _MOVING and elev._going_direction is Direction.UP:
+                new_elev = elev._clone()
+                new_elev.handle_event(_REACHED_EVENTS[elev._current_floor + 1])
                 next_elev.add(new_elev)
 
-            if (
-                isinstance(elev._state, Moving)
-                and elev._going_direction == Direction.DOWN
-            ):
-                new_elev = copy.deepcopy(elev)
-                new_elev.handle_event(ReachedFloor(floor=elev._current_floor - 1))
+            if elev._state_kind == _MOVING and elev._going_direction is Direction.DOWN:
+                new_elev = elev._clone()
+                new_elev.handle_event(_REACHED_EVENTS[elev._current_floor - 1])
                 next_elev.add(new_elev)
 
             # simulate door close
-            if isinstance(elev._state, Loading) and do_it():
-                new_elev = copy.deepcopy(elev)
-                new_elev.handle_event(TimerExpired())
+            if elev._state_kind == _LOADING and do_it():
+                new_elev = elev._clone()
+                new_elev.handle_event(_TIMER_EXPIRED)
                 next_elev.add(new_elev)
 
             if not next_elev:
@@ -584,16 +725,22 @@ class Simulator:
             return next_elev
 
         control = ElevatorControl(queit=True)
-        to_check = deque([Elevator(1, control)])
-        seen = set()
+        initial_key = Elevator(1, control)._key()
+        # elevators are deduplicated and queued by their packed int key, and
+        # only rebuilt when they get checked
+        to_check = deque([initial_key])
+        seen = {initial_key}
         while to_check:
-            elev = to_check.popleft()
+            elev = Elevator._from_key(to_check.popleft(), control)
             elev.validate()
             next_elevs = get_next_elevator(elev)
             for e in next_elevs:
-                if e not in seen:
-                    to_check.append(e)
-                    seen.add(e)
+                key = e._key()
+                if key not in seen:
+                    to_check.append(key)
+                    seen.add(key)
+            # only the keys are kept, so the successors can be reused
+            _elev_pool.extend(next_elevs)
             print(f"to_check: {len(to_check)}, seen: {len(seen)}")
         # print(seen)
 